@@ -1,18 +1,18 @@
 from collections import namedtuple
-import scipy as sp
 import numpy as np
 import operator as op
 import scipy.ndimage as spim
 import scipy.spatial as sptl
 import warnings
+from functools import lru_cache
 from scipy.signal import fftconvolve
 from tqdm import tqdm
-from numba import jit
+from numba import jit, njit, prange, config
 from skimage.segmentation import clear_border
 from skimage.morphology import ball, disk, square, cube, diamond, octahedron
 from skimage.morphology import reconstruction, watershed
 from porespy.tools import randomize_colors, fftmorphology
-from porespy.tools import get_border, extend_slice, extract_subsection
+from porespy.tools import get_border, extract_subsection
 from porespy.tools import ps_disk, ps_ball
 from porespy.tools import _create_alias_map
 
@@ -43,9 +43,9 @@ def trim_small_clusters(im, size=1):
         strel = ball(1)
     else:
         raise Exception('Only 2D or 3D images are accepted')
-    filtered_array = sp.copy(im)
+    filtered_array = np.copy(im)
     labels, N = spim.label(filtered_array, structure=strel)
-    id_sizes = sp.array(spim.sum(im, labels, range(N + 1)))
+    id_sizes = np.array(spim.sum(im, labels, range(N + 1)))
     area_mask = (id_sizes <= size)
     filtered_array[area_mask[labels]] = 0
     return filtered_array
@@ -115,28 +115,28 @@ def distance_transform_lin(im, axis=0, mode='both'):
                       ' Reduce dimensionality with np.squeeze(im) to avoid' +
                       ' unexpected behavior.')
     if mode in ['backward', 'reverse']:
-        im = sp.flip(im, axis)
+        im = np.flip(im, axis)
         im = distance_transform_lin(im=im, axis=axis, mode='forward')
-        im = sp.flip(im, axis)
+        im = np.flip(im, axis)
         return im
     elif mode in ['both']:
         im_f = distance_transform_lin(im=im, axis=axis, mode='forward')
         im_b = distance_transform_lin(im=im, axis=axis, mode='backward')
-        return sp.minimum(im_f, im_b)
+        return np.minimum(im_f, im_b)
     else:
-        b = sp.cumsum(im > 0, axis=axis)
-        c = sp.diff(b*(im == 0), axis=axis)
-        d = sp.minimum.accumulate(c, axis=axis)
+        b = np.cumsum(im > 0, axis=axis)
+        c = np.diff(b*(im == 0), axis=axis)
+        d = np.minimum.accumulate(c, axis=axis)
         if im.ndim == 1:
-            e = sp.pad(d, pad_width=[1, 0], mode='constant', constant_values=0)
+            e = np.pad(d, pad_width=[1, 0], mode='constant', constant_values=0)
         elif im.ndim == 2:
             ax = [[[1, 0], [0, 0]], [[0, 0], [1, 0]]]
-            e = sp.pad(d, pad_width=ax[axis], mode='constant', constant_values=0)
+            e = np.pad(d, pad_width=ax[axis], mode='constant', constant_values=0)
         elif im.ndim == 3:
             ax = [[[1, 0], [0, 0], [0, 0]],
                   [[0, 0], [1, 0], [0, 0]],
                   [[0, 0], [0, 0], [1, 0]]]
-            e = sp.pad(d, pad_width=ax[axis], mode='constant', constant_values=0)
+            e = np.pad(d, pad_width=ax[axis], mode='constant', constant_values=0)
         f = im*(b + e)
         return f
 
@@ -200,6 +200,12 @@ def snow_partitioning(im, dt=None, r_max=4, sigma=0.4, return_all=False,
         * ``regions``: The void space partitioned into pores using a marker
         based watershed with the peaks found by the SNOW algorithm
 
+    If the `edt <https://github.com/seung-lab/euclidean-distance-transform-3d>`_
+    package is installed it is used to compute the distance transform, since
+    it runs in parallel and is much faster than the version in
+    ``scipy.ndimage`` for large 3D images.  The result is identical to
+    ``scipy.ndimage.distance_transform_edt`` either way.
+
     References
     ----------
     [1] Gostick, J. "A versatile and efficient network extraction algorithm
@@ -209,18 +215,28 @@ def snow_partitioning(im, dt=None, r_max=4, sigma=0.4, return_all=False,
     tup = namedtuple('results', field_names=['im', 'dt', 'peaks', 'regions'])
     print('_'*60)
     print("Beginning SNOW Algorithm")
-    im_shape = sp.array(im.shape)
+    im_shape = np.array(im.shape)
     if im.dtype is not bool:
         print('Converting supplied image (im) to boolean')
         im = im > 0
+    # im can be reused in find_peaks only if it's known to match dt > 0
+    im_peaks = None
     if dt is None:
         print('Peforming Distance Transform')
-        if sp.any(im_shape == 1):
-            ax = sp.where(im_shape == 1)[0][0]
-            dt = spim.distance_transform_edt(input=im.squeeze())
-            dt = sp.expand_dims(dt, ax)
+        im_peaks = im
+        try:  # Use the multithreaded edt package if it's available
+            from edt import edtsq
+            # edtsq gives exact integer squared distances, so taking the root
+            # in double precision matches scipy's result bit for bit
+            dt_func = lambda im: np.sqrt(edtsq(im, parallel=-1), dtype=float)
+        except ModuleNotFoundError:
+            dt_func = spim.distance_transform_edt
+        if np.any(im_shape == 1):
+            ax = np.where(im_shape == 1)[0][0]
+            dt = dt_func(im.squeeze())
+            dt = np.expand_dims(dt, ax)
         else:
-            dt = spim.distance_transform_edt(input=im)
+            dt = dt_func(im)
 
     tup.im = im
     tup.dt = dt
@@ -228,8 +244,9 @@ def snow_partitioning(im, dt=None, r_max=4, sigma=0.4, return_all=False,
     if sigma > 0:
         print('Applying Gaussian blur with sigma =', str(sigma))
         dt = spim.gaussian_filter(input=dt, sigma=sigma)
+        im_peaks = None  # Blurring spreads dt into the solid
 
-    peaks = find_peaks(dt=dt, r_max=r_max)
+    peaks = find_peaks(dt=dt, r_max=r_max, im=im_peaks)
     print('Initial number of peaks: ', spim.label(peaks)[1])
     peaks = trim_saddle_points(peaks=peaks, dt=dt, max_iters=500)
     print('Peaks after trimming saddle points: ', spim.label(peaks)[1])
@@ -329,8 +346,8 @@ def snow_partitioning_n(im, r_max=4, sigma=0.4, return_all=True,
     # Get alias if provided by user
     al = _create_alias_map(im=im, alias=alias)
     # Perform snow on each phase and merge all segmentation and dt together
-    phases_num = sp.unique(im * 1)
-    phases_num = sp.trim_zeros(phases_num)
+    phases_num = np.unique(im * 1)
+    phases_num = np.trim_zeros(phases_num)
     combined_dt = 0
     combined_region = 0
     num = [0]
@@ -354,7 +371,7 @@ def snow_partitioning_n(im, r_max=4, sigma=0.4, return_all=True,
             phase_ws = phase_snow.regions * phase_snow.im
             phase_ws[phase_ws == num[i - 1]] = 0
             combined_region += phase_ws
-        num.append(sp.amax(combined_region))
+        num.append(np.amax(combined_region))
     if return_all:
         tup = namedtuple('results', field_names=['im', 'dt', 'phase_max_label',
                                                  'regions'])
@@ -367,7 +384,19 @@ def snow_partitioning_n(im, r_max=4, sigma=0.4, return_all=True,
         return combined_region
 
 
-def find_peaks(dt, r_max=4, footprint=None):
+@lru_cache(maxsize=32)
+def _get_strel(func, r):
+    r"""
+    Returns the structuring element produced by ``func(r)``, such as
+    ``skimage.morphology.ball``.  Results are cached so repeated calls don't
+    rebuild the same array, so it is made read-only to protect the cache.
+    """
+    strel = func(r)
+    strel.flags.writeable = False
+    return strel
+
+
+def find_peaks(dt, r_max=4, footprint=None, im=None):
     r"""
     Returns all local maxima in the distance transform
 
@@ -381,10 +410,25 @@ def find_peaks(dt, r_max=4, footprint=None):
         The size of the structuring element used in the maximum filter.  This
         controls the localness of any maxima. The default is 4 voxels.
 
-    footprint : ND-array
+    footprint : string or function
         Specifies the shape of the structuring element used to define the
-        neighborhood when looking for peaks.  If none is specified then a
-        spherical shape is used (or circular in 2D).
+        neighborhood when looking for peaks.  Options are:
+
+        'sphere' - A spherical shape (or circular in 2D) of radius ``r_max``.
+        This is the default.
+
+        'cube' - A cubic shape (or square in 2D) of width ``2*r_max + 1``.
+        This is applied as a sequence of 1D filters along each axis so is
+        significantly faster than 'sphere', but finds fewer peaks.
+
+        Alternatively a function can be given which accepts ``r_max`` and
+        returns a structuring element, such as ``skimage.morphology.ball``.
+
+    im : ND-array
+        The boolean image of the pore space from which ``dt`` was computed.
+        If not given it is found as ``dt > 0``, but if it is already on hand
+        (such as inside ``snow_partitioning``) passing it avoids an extra pass
+        over the image.
 
     Returns
     -------
@@ -401,22 +445,30 @@ def find_peaks(dt, r_max=4, footprint=None):
     indices=False)``
 
     This automatically uses a square structuring element which is significantly
-    faster than using a circular or spherical element.
+    faster than using a circular or spherical element, and is equivalent to
+    using ``footprint='cube'``.
     """
-    im = dt > 0
+    if im is None:
+        im = dt > 0
     if im.ndim != im.squeeze().ndim:
         warnings.warn('Input image conains a singleton axis:' + str(im.shape) +
                       ' Reduce dimensionality with np.squeeze(im) to avoid' +
                       ' unexpected behavior.')
     if footprint is None:
-        if im.ndim == 2:
-            footprint = disk
-        elif im.ndim == 3:
-            footprint = ball
+        footprint = 'sphere'
+    # Set solid voxels to a value of 2 so peaks cannot be found beside them
+    if footprint == 'cube':
+        mx = spim.maximum_filter(np.where(im, dt, 2), size=2*r_max+1)
+    else:
+        if footprint == 'sphere':
+            if im.ndim not in [2, 3]:
+                raise Exception("only 2-d and 3-d images are supported")
+            strel = _get_strel(disk if im.ndim == 2 else ball, r_max)
         else:
-            raise Exception("only 2-d and 3-d images are supported")
-    mx = spim.maximum_filter(dt + 2*(~im), footprint=footprint(r_max))
-    peaks = (dt == mx)*im
+            strel = footprint(r_max)
+        mx = spim.maximum_filter(np.where(im, dt, 2), footprint=strel)
+    peaks = np.equal(dt, mx)
+    peaks &= im
     return peaks
 
 
@@ -447,17 +499,32 @@ def reduce_peaks(peaks):
         strel = square
     else:
         strel = cube
-    markers, N = spim.label(input=peaks, structure=strel(3))
-    inds = spim.measurements.center_of_mass(input=peaks,
-                                            labels=markers,
-                                            index=sp.arange(1, N+1))
-    inds = sp.floor(inds).astype(int)
+    markers, N = spim.label(input=peaks, structure=_get_strel(strel, 3))
+    inds = np.floor(_find_centroids(markers, N)).astype(int)
     # Centroid may not be on old pixel, so create a new peaks image
-    peaks_new = sp.zeros_like(peaks, dtype=bool)
+    peaks_new = np.zeros_like(peaks, dtype=bool)
     peaks_new[tuple(inds.T)] = True
     return peaks_new
 
 
+def _find_centroids(labels, N):
+    r"""
+    Finds the center of mass of each of the ``N`` regions in a labelled image.
+    The image is scanned once to gather the labelled voxels, and the sums
+    are then computed over those voxels only.  This is much faster than
+    ``scipy.ndimage.center_of_mass`` for sparse images such as peaks, which
+    makes a pass over the full image for each axis.
+
+    Returns an N-by-ndim array of coordinates.
+    """
+    inds = np.where(labels)
+    vals = labels[inds]
+    counts = np.bincount(vals, minlength=N+1)[1:]
+    crds = np.vstack([np.bincount(vals, weights=i, minlength=N+1)[1:]
+                      for i in inds]).T
+    return crds/counts[:, None]
+
+
 def trim_saddle_points(peaks, dt, max_iters=10):
     r"""
     Removes peaks that were mistakenly identified because they lied on a
@@ -491,38 +558,164 @@ def trim_saddle_points(peaks, dt, max_iters=10):
     using marker-based watershed segmenation".  Physical Review E. (2017)
 
     """
-    peaks = sp.copy(peaks)
-    if dt.ndim == 2:
-        from skimage.morphology import square as cube
-    else:
-        from skimage.morphology import cube
+    peaks = np.copy(peaks)
     labels, N = spim.label(peaks)
     slices = spim.find_objects(labels)
-    for i in range(N):
-        s = extend_slice(s=slices[i], shape=peaks.shape, pad=10)
-        peaks_i = labels[s] == i+1
-        dt_i = dt[s]
-        im_i = dt_i > 0
-        iters = 0
-        peaks_dil = sp.copy(peaks_i)
-        while iters < max_iters:
-            iters += 1
-            peaks_dil = spim.binary_dilation(input=peaks_dil,
-                                             structure=cube(3))
-            peaks_max = peaks_dil*sp.amax(dt_i*peaks_dil)
-            peaks_extended = (peaks_max == dt_i)*im_i
-            if sp.all(peaks_extended == peaks_i):
-                break  # Found a true peak
-            elif sp.sum(peaks_extended*peaks_i) == 0:
-                peaks_i = False
-                break  # Found a saddle point
-        peaks[s] = peaks_i
-        if iters >= max_iters:
-            print('Maximum number of iterations reached, consider'
-                  + 'running again with a larger value of max_iters')
+    # Store the slice around each peak as an array of bounds, then extend
+    # them all at once by 10 voxels without going outside the image
+    bounds = np.zeros([N, 3, 2], dtype=int)
+    bounds[:, :, 1] = 1
+    temp = [[x.start, x.stop] for s in slices for x in s]
+    bounds[:, :peaks.ndim] = np.reshape(temp, [N, peaks.ndim, 2])
+    bounds[:, :peaks.ndim, 0] = np.maximum(bounds[:, :peaks.ndim, 0] - 10, 0)
+    bounds[:, :peaks.ndim, 1] = np.minimum(bounds[:, :peaks.ndim, 1] + 10,
+                                           peaks.shape)
+    # Kernel works in 3D, a 2D image is treated as a single layer
+    iters = _trim_saddle_points(np.atleast_3d(peaks), np.atleast_3d(dt),
+                                np.atleast_3d(labels), bounds, max_iters,
+                                config.NUMBA_NUM_THREADS)
+    if np.any(iters >= max_iters):
+        print('Maximum number of iterations reached, consider'
+              + 'running again with a larger value of max_iters')
     return peaks
 
 
+@njit(cache=True, parallel=True)
+def _trim_saddle_points(peaks, dt, labels, bounds, max_iters, n_threads):
+    r"""
+    Applies ``_trim_saddle_region`` to each labelled peak, writing the result
+    into ``peaks`` in-place.  This is the kernel used by
+    ``trim_saddle_points`` so that all peaks are processed in a single call.
+
+    The peaks are shared among ``n_threads`` threads, then the results are
+    written back in order since the slices around neighboring peaks overlap.
+
+    Returns an array containing the number of iterations performed on each
+    peak.
+    """
+    N = bounds.shape[0]
+    keep = np.ones(N, dtype=np.bool_)
+    iters = np.zeros(N, dtype=np.int64)
+    # Find size of the largest slice, so buffers can be reused for each peak
+    size = np.zeros(3, dtype=np.int64)
+    for n in range(N):
+        for d in range(3):
+            size[d] = max(size[d], bounds[n, d, 1] - bounds[n, d, 0])
+    n_threads = min(n_threads, N)
+    for t in prange(n_threads):
+        peaks_buf = np.zeros((size[0], size[1], size[2]), dtype=np.bool_)
+        cur_buf = np.zeros_like(peaks_buf)
+        nxt_buf = np.zeros_like(peaks_buf)
+        for n in range(t, N, n_threads):
+            x0, x1 = bounds[n, 0, 0], bounds[n, 0, 1]
+            y0, y1 = bounds[n, 1, 0], bounds[n, 1, 1]
+            z0, z1 = bounds[n, 2, 0], bounds[n, 2, 1]
+            peaks_i = peaks_buf[:x1-x0, :y1-y0, :z1-z0]
+            cur = cur_buf[:x1-x0, :y1-y0, :z1-z0]
+            nxt = nxt_buf[:x1-x0, :y1-y0, :z1-z0]
+            for i in range(x1-x0):
+                for j in range(y1-y0):
+                    for k in range(z1-z0):
+                        peaks_i[i, j, k] = labels[x0+i, y0+j, z0+k] == n+1
+                        cur[i, j, k] = peaks_i[i, j, k]
+                        nxt[i, j, k] = False
+            keep[n], iters[n] = _trim_saddle_region(dt[x0:x1, y0:y1, z0:z1],
+                                                    peaks_i, cur, nxt,
+                                                    max_iters)
+    for n in range(N):
+        x0, x1 = bounds[n, 0, 0], bounds[n, 0, 1]
+        y0, y1 = bounds[n, 1, 0], bounds[n, 1, 1]
+        z0, z1 = bounds[n, 2, 0], bounds[n, 2, 1]
+        if keep[n]:
+            peaks[x0:x1, y0:y1, z0:z1] = labels[x0:x1, y0:y1, z0:z1] == n+1
+        else:
+            peaks[x0:x1, y0:y1, z0:z1] = False  # Found a saddle point
+    return iters
+
+
+@njit(cache=True)
+def _trim_saddle_region(dt_i, peaks_i, cur, nxt, max_iters):
+    r"""
+    Iteratively dilates a single peak until it either extends to a true peak
+    or is found to lie on a saddle point.  This is the kernel used by
+    ``trim_saddle_points`` and operates on a 3D slice around the peak.
+
+    ``cur`` and ``nxt`` are work arrays the same shape as ``peaks_i``, which
+    must contain a copy of ``peaks_i`` and all ``False`` respectively.  They
+    are overwritten.
+
+    Returns a tuple containing a boolean indicating whether the peak should be
+    kept, and the number of iterations that were performed.
+    """
+    shape = np.array(dt_i.shape)
+    # Find bounding box of the peak, which grows by 1 on each dilation
+    lo = shape.copy()
+    hi = np.zeros(3, dtype=np.int64)
+    for i in range(shape[0]):
+        for j in range(shape[1]):
+            for k in range(shape[2]):
+                if peaks_i[i, j, k]:
+                    lo[0], hi[0] = min(lo[0], i), max(hi[0], i+1)
+                    lo[1], hi[1] = min(lo[1], j), max(hi[1], j+1)
+                    lo[2], hi[2] = min(lo[2], k), max(hi[2], k+1)
+    keep = True
+    iters = 0
+    while iters < max_iters:
+        iters += 1
+        for d in range(3):
+            lo[d] = max(lo[d] - 1, 0)
+            hi[d] = min(hi[d] + 1, shape[d])
+        cur_max = _dilate_region(cur, nxt, dt_i, lo, hi)
+        cur, nxt = nxt, cur
+        # Compare extended peak with the original one
+        same = True
+        overlap = False
+        for i in range(lo[0], hi[0]):
+            for j in range(lo[1], hi[1]):
+                for k in range(lo[2], hi[2]):
+                    ext = cur[i, j, k] and (dt_i[i, j, k] == cur_max) \
+                        and (dt_i[i, j, k] > 0)
+                    if ext != peaks_i[i, j, k]:
+                        same = False
+                    if ext and peaks_i[i, j, k]:
+                        overlap = True
+        if same:
+            break  # Found a true peak
+        elif not overlap:
+            keep = False
+            break  # Found a saddle point
+    return keep, iters
+
+
+@njit(cache=True)
+def _dilate_region(im, out, dt, lo, hi):
+    r"""
+    Dilates ``im`` with a 3x3x3 cube into ``out`` within the box given by
+    ``lo`` and ``hi``, and returns the maximum value of ``dt`` in the dilated
+    region.  ``im`` must be ``False`` everywhere outside the box.
+    """
+    nx, ny, nz = im.shape
+    out_max = -np.inf
+    for i in range(lo[0], hi[0]):
+        for j in range(lo[1], hi[1]):
+            for k in range(lo[2], hi[2]):
+                hit = False
+                for a in range(max(i-1, 0), min(i+2, nx)):
+                    for b in range(max(j-1, 0), min(j+2, ny)):
+                        for c in range(max(k-1, 0), min(k+2, nz)):
+                            if im[a, b, c]:
+                                hit = True
+                                break
+                        if hit:
+                            break
+                    if hit:
+                        break
+                out[i, j, k] = hit
+                if hit and (dt[i, j, k] > out_max):
+                    out_max = dt[i, j, k]
+    return out_max
+
+
 def trim_nearby_peaks(peaks, dt):
     r"""
     Finds pairs of peaks that are nearer to each other than to the solid phase,
@@ -555,36 +748,33 @@ def trim_nearby_peaks(peaks, dt):
     [1] Gostick, J. "A versatile and efficient network extraction algorithm
     using marker-based watershed segmenation".  Physical Review E. (2017)
     """
-    peaks = sp.copy(peaks)
-    if dt.ndim == 2:
-        from skimage.morphology import square as cube
-    else:
-        from skimage.morphology import cube
-    peaks, N = spim.label(peaks, structure=cube(3))
-    crds = spim.measurements.center_of_mass(peaks, labels=peaks,
-                                            index=sp.arange(1, N+1))
-    crds = sp.vstack(crds).astype(int)  # Convert to numpy array of ints
-    # Get distance between each peak as a distance map
-    tree = sptl.cKDTree(data=crds)
-    temp = tree.query(x=crds, k=2)
-    nearest_neighbor = temp[1][:, 1]
-    dist_to_neighbor = temp[0][:, 1]
-    del temp, tree  # Free-up memory
+    peaks = np.copy(peaks)
+    strel = square if dt.ndim == 2 else cube
+    peaks, N = spim.label(peaks, structure=_get_strel(strel, 3))
+    crds = _find_centroids(peaks, N).astype(int)  # Convert to array of ints
     dist_to_solid = dt[tuple(crds.T)]  # Get distance to solid for each peak
-    hits = sp.where(dist_to_neighbor < dist_to_solid)[0]
-    # Drop peak that is closer to the solid than it's neighbor
-    drop_peaks = []
-    for peak in hits:
-        if dist_to_solid[peak] < dist_to_solid[nearest_neighbor[peak]]:
-            drop_peaks.append(peak)
-        else:
-            drop_peaks.append(nearest_neighbor[peak])
-    drop_peaks = sp.unique(drop_peaks)
-    # Remove peaks from image
-    slices = spim.find_objects(input=peaks)
-    for s in drop_peaks:
-        peaks[slices[s]] = 0
-    return (peaks > 0)
+    # Find all neighbors of each peak that are within its distance to solid
+    tree = sptl.cKDTree(data=crds, balanced_tree=False, compact_nodes=False)
+    nbrs = tree.query_ball_point(x=crds, r=dist_to_solid, n_jobs=-1)
+    del tree  # Free-up memory
+    i = np.repeat(np.arange(N), [len(n) for n in nbrs])
+    j = np.concatenate(nbrs).astype(int)
+    # Keep pairs that are strictly closer to each other than to the solid
+    dist_to_neighbor = np.sqrt(np.sum((crds[i] - crds[j])**2, axis=1))
+    # Compare in the precision of dt so exact ties are not broken by rounding
+    dist_to_neighbor = dist_to_neighbor.astype(dt.dtype)
+    hits = (i != j) * (dist_to_neighbor < dist_to_solid[i])
+    i, j = i[hits], j[hits]
+    # Drop peak that is closer to the solid than it's neighbor, and break ties
+    # by dropping the one with the higher label so that one is always kept
+    a, b = dist_to_solid[i], dist_to_solid[j]
+    drop_i = (a < b) + ((a == b) * (i > j))
+    drop_peaks = np.unique(np.where(drop_i, i, j))
+    # Remove peaks from image using a lookup table of labels to keep
+    keep = np.ones(N+1, dtype=bool)
+    keep[0] = False
+    keep[drop_peaks + 1] = False
+    return keep[peaks]
 
 
 def find_disconnected_voxels(im, conn=None):
@@ -656,7 +846,7 @@ def fill_blind_pores(im):
     find_disconnected_voxels
 
     """
-    im = sp.copy(im)
+    im = np.copy(im)
     holes = find_disconnected_voxels(im)
     im[holes] = False
     return im
@@ -681,7 +871,7 @@ def trim_floating_solid(im):
     find_disconnected_voxels
 
     """
-    im = sp.copy(im)
+    im = np.copy(im)
     holes = find_disconnected_voxels(~im)
     im[holes] = True
     return im
@@ -729,8 +919,8 @@ def trim_nonpercolating_paths(im, inlet_axis=0, outlet_axis=0):
                       ' unexpected behavior.')
     im = trim_floating_solid(~im)
     labels = spim.label(~im)[0]
-    inlet = sp.zeros_like(im, dtype=int)
-    outlet = sp.zeros_like(im, dtype=int)
+    inlet = np.zeros_like(im, dtype=int)
+    outlet = np.zeros_like(im, dtype=int)
     if im.ndim == 3:
         if inlet_axis == 0:
             inlet[0, :, :] = 1
@@ -756,9 +946,9 @@ def trim_nonpercolating_paths(im, inlet_axis=0, outlet_axis=0):
             outlet[-1, :] = 1
         elif outlet_axis == 1:
             outlet[:, -1] = 1
-    IN = sp.unique(labels*inlet)
-    OUT = sp.unique(labels*outlet)
-    new_im = sp.isin(labels, list(set(IN) ^ set(OUT)), invert=True)
+    IN = np.unique(labels*inlet)
+    OUT = np.unique(labels*outlet)
+    new_im = np.isin(labels, list(set(IN) ^ set(OUT)), invert=True)
     im[new_im == 0] = True
     return ~im
 
@@ -840,25 +1030,25 @@ def flood(im, regions=None, mode='max'):
     if regions is None:
         labels, N = spim.label(mask)
     else:
-        labels = sp.copy(regions)
+        labels = np.copy(regions)
         N = labels.max()
     I = im.flatten()
     L = labels.flatten()
     if mode.startswith('max'):
-        V = sp.zeros(shape=N+1, dtype=float)
+        V = np.zeros(shape=N+1, dtype=float)
         for i in range(len(L)):
             if V[L[i]] < I[i]:
                 V[L[i]] = I[i]
     elif mode.startswith('min'):
-        V = sp.ones(shape=N+1, dtype=float)*sp.inf
+        V = np.ones(shape=N+1, dtype=float)*np.inf
         for i in range(len(L)):
             if V[L[i]] > I[i]:
                 V[L[i]] = I[i]
     elif mode.startswith('size'):
-        V = sp.zeros(shape=N+1, dtype=int)
+        V = np.zeros(shape=N+1, dtype=int)
         for i in range(len(L)):
             V[L[i]] += 1
-    im_flooded = sp.reshape(V[labels], newshape=im.shape)
+    im_flooded = np.reshape(V[labels], newshape=im.shape)
     im_flooded = im_flooded*mask
     return im_flooded
 
@@ -887,12 +1077,12 @@ def find_dt_artifacts(dt):
         the image.  Obviously, voxels with a value of zero have no error.
 
     """
-    temp = sp.ones(shape=dt.shape)*sp.inf
+    temp = np.ones(shape=dt.shape)*np.inf
     for ax in range(dt.ndim):
-        dt_lin = distance_transform_lin(sp.ones_like(temp, dtype=bool),
+        dt_lin = distance_transform_lin(np.ones_like(temp, dtype=bool),
                                         axis=ax, mode='both')
-        temp = sp.minimum(temp, dt_lin)
-    result = sp.clip(dt - temp, a_min=0, a_max=sp.inf)
+        temp = np.minimum(temp, dt_lin)
+    result = np.clip(dt - temp, a_min=0, a_max=np.inf)
     return result
 
 
@@ -917,7 +1107,7 @@ def region_size(im):
     """
     if im.dtype == bool:
         im = spim.label(im)[0]
-    counts = sp.bincount(im.flatten())
+    counts = np.bincount(im.flatten())
     counts[0] = 0
     chords = counts[im]
     return chords
@@ -970,15 +1160,15 @@ def apply_chords(im, spacing=1, axis=0, trim_edges=True, label=False):
         raise Exception('Spacing cannot be less than 0')
     if spacing == 0:
         label = True
-    result = sp.zeros(im.shape, dtype=int)  # Will receive chords at end
+    result = np.zeros(im.shape, dtype=int)  # Will receive chords at end
     slxyz = [slice(None, None, spacing*(axis != i) + 1) for i in [0, 1, 2]]
     slices = tuple(slxyz[:im.ndim])
     s = [[0, 1, 0], [0, 1, 0], [0, 1, 0]]  # Straight-line structuring element
     if im.ndim == 3:  # Make structuring element 3D if necessary
-        s = sp.pad(sp.atleast_3d(s), pad_width=((0, 0), (0, 0), (1, 1)),
+        s = np.pad(np.atleast_3d(s), pad_width=((0, 0), (0, 0), (1, 1)),
                    mode='constant', constant_values=0)
     im = im[slices]
-    s = sp.swapaxes(s, 0, axis)
+    s = np.swapaxes(s, 0, axis)
     chords = spim.label(im, structure=s)[0]
     if trim_edges:  # Label on border chords will be set to 0
         chords = clear_border(chords)
@@ -1033,7 +1223,7 @@ def apply_chords_3D(im, spacing=0, trim_edges=True):
         raise Exception('Must be a 3D image to use this function')
     if spacing < 0:
         raise Exception('Spacing cannot be less than 0')
-    ch = sp.zeros_like(im, dtype=int)
+    ch = np.zeros_like(im, dtype=int)
     ch[:, ::4+2*spacing, ::4+2*spacing] = 1  # X-direction
     ch[::4+2*spacing, :, 2::4+2*spacing] = 2  # Y-direction
     ch[2::4+2*spacing, 2::4+2*spacing, :] = 3  # Z-direction
@@ -1195,9 +1385,9 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
         inlets = get_border(im.shape, mode='faces')
 
     if isinstance(sizes, int):
-        sizes = sp.logspace(start=sp.log10(sp.amax(dt)), stop=0, num=sizes)
+        sizes = np.logspace(start=np.log10(np.amax(dt)), stop=0, num=sizes)
     else:
-        sizes = sp.unique(sizes)[-1::-1]
+        sizes = np.unique(sizes)[-1::-1]
 
     if im.ndim == 2:
         strel = ps_disk
@@ -1205,38 +1395,38 @@ def porosimetry(im, sizes=25, inlets=None, access_limited=True,
         strel = ps_ball
 
     if mode == 'mio':
-        pw = int(sp.floor(dt.max()))
-        impad = sp.pad(im, mode='symmetric', pad_width=pw)
-        inletspad = sp.pad(inlets, mode='symmetric', pad_width=pw)
-        inlets = sp.where(inletspad)
-#        sizes = sp.unique(sp.around(sizes, decimals=0).astype(int))[-1::-1]
-        imresults = sp.zeros(sp.shape(impad))
+        pw = int(np.floor(dt.max()))
+        impad = np.pad(im, mode='symmetric', pad_width=pw)
+        inletspad = np.pad(inlets, mode='symmetric', pad_width=pw)
+        inlets = np.where(inletspad)
+#        sizes = np.unique(np.around(sizes, decimals=0).astype(int))[-1::-1]
+        imresults = np.zeros(np.shape(impad))
         for r in tqdm(sizes):
             imtemp = fftmorphology(impad, strel(r), mode='erosion')
             if access_limited:
                 imtemp = trim_disconnected_blobs(imtemp, inlets)
             imtemp = fftmorphology(imtemp, strel(r), mode='dilation')
-            if sp.any(imtemp):
+            if np.any(imtemp):
                 imresults[(imresults == 0)*imtemp] = r
         imresults = extract_subsection(imresults, shape=im.shape)
     elif mode == 'dt':
-        inlets = sp.where(inlets)
-        imresults = sp.zeros(sp.shape(im))
+        inlets = np.where(inlets)
+        imresults = np.zeros(np.shape(im))
         for r in tqdm(sizes):
             imtemp = dt >= r
             if access_limited:
                 imtemp = trim_disconnected_blobs(imtemp, inlets)
-            if sp.any(imtemp):
+            if np.any(imtemp):
                 imtemp = spim.distance_transform_edt(~imtemp) < r
                 imresults[(imresults == 0)*imtemp] = r
     elif mode == 'hybrid':
-        inlets = sp.where(inlets)
-        imresults = sp.zeros(sp.shape(im))
+        inlets = np.where(inlets)
+        imresults = np.zeros(np.shape(im))
         for r in tqdm(sizes):
             imtemp = dt >= r
             if access_limited:
                 imtemp = trim_disconnected_blobs(imtemp, inlets)
-            if sp.any(imtemp):
+            if np.any(imtemp):
                 imtemp = fftconvolve(imtemp, strel(r), mode='same') > 0.0001
                 imresults[(imresults == 0)*imtemp] = r
     else:
@@ -1265,20 +1455,20 @@ def trim_disconnected_blobs(im, inlets):
         voxels not connected to the ``inlets`` removed.
     """
     if type(inlets) == tuple:
-        temp = sp.copy(inlets)
-        inlets = sp.zeros_like(im, dtype=bool)
+        temp = np.copy(inlets)
+        inlets = np.zeros_like(im, dtype=bool)
         inlets[temp] = True
     elif (inlets.shape == im.shape) and (inlets.max() == 1):
         inlets = inlets.astype(bool)
     else:
         raise Exception('inlets not valid, refer to docstring for info')
     labels = spim.label(inlets + (im > 0))[0]
-    keep = sp.unique(labels[inlets])
+    keep = np.unique(labels[inlets])
     keep = keep[keep > 0]
     if len(keep) > 0:
-        im2 = sp.reshape(sp.in1d(labels, keep), newshape=im.shape)
+        im2 = np.reshape(np.in1d(labels, keep), newshape=im.shape)
     else:
-        im2 = sp.zeros_like(im)
+        im2 = np.zeros_like(im)
     im2 = im2*im
     return im2
 
@@ -1418,25 +1608,22 @@ def prune_branches(skel, branch_points=None, iterations=1):
 
     """
     skel = skel > 0
-    if skel.ndim == 2:
-        from skimage.morphology import square as cube
-    else:
-        from skimage.morphology import cube
+    strel = _get_strel(square if skel.ndim == 2 else cube, 3)
     # Create empty image to house results
-    im_result = sp.zeros_like(skel)
+    im_result = np.zeros_like(skel)
     # If branch points are not supplied, attempt to find them
     if branch_points is None:
-        branch_points = spim.convolve(skel*1.0, weights=cube(3)) > 3
+        branch_points = spim.convolve(skel*1.0, weights=strel) > 3
         branch_points = branch_points*skel
     # Store original branch points before dilating
     pts_orig = branch_points
     # Find arcs of skeleton by deleting branch points
     arcs = skel*(~branch_points)
     # Label arcs
-    arc_labels = spim.label(arcs, structure=cube(3))[0]
+    arc_labels = spim.label(arcs, structure=strel)[0]
     # Dilate branch points so they overlap with the arcs
-    branch_points = spim.binary_dilation(branch_points, structure=cube(3))
-    pts_labels = spim.label(branch_points, structure=cube(3))[0]
+    branch_points = spim.binary_dilation(branch_points, structure=strel)
+    pts_labels = spim.label(branch_points, structure=strel)[0]
     # Now scan through each arc to see if it's connected to two branch points
     slices = spim.find_objects(arc_labels)
     label_num = 0
@@ -1445,16 +1632,16 @@ def prune_branches(skel, branch_points=None, iterations=1):
         # Find branch point labels the overlap current arc
         hits = pts_labels[s]*(arc_labels[s] == label_num)
         # If image contains 2 branch points, then it's not a tail.
-        if len(sp.unique(hits)) == 3:
+        if len(np.unique(hits)) == 3:
             im_result[s] += arc_labels[s] == label_num
     # Add missing branch points back to arc image to make complete skeleton
     im_result += skel*pts_orig
     if iterations > 1:
         iterations -= 1
-        im_temp = sp.copy(im_result)
+        im_temp = np.copy(im_result)
         im_result = prune_branches(skel=im_result,
                                    branch_points=None,
                                    iterations=iterations)
-        if sp.all(im_temp == im_result):
+        if np.all(im_temp == im_result):
             iterations = 0
     return im_result
@@ -91,11 +91,12 @@ def regions_to_network(im, dt=None, voxel_size=1):
             if j > pore:
                 t_conns.append([pore, j])
                 vx = sp.where(im_w_throats == (j + 1))
-                t_dia_inscribed.append(2*sp.amax(sub_dt[vx]))
-                t_perimeter.append(sp.sum(sub_dt[vx] < 2))
+                t_dt = sub_dt[vx]  # Gather dt values on throat voxels once
+                t_dia_inscribed.append(2*sp.amax(t_dt))
+                t_perimeter.append(sp.sum(t_dt < 2))
                 t_area.append(sp.size(vx[0]))
                 t_inds = tuple([i+j for i, j in zip(vx, s_offset)])
-                temp = sp.where(dt[t_inds] == sp.amax(dt[t_inds]))[0][0]
+                temp = sp.argmax(t_dt)
                 if im.ndim == 2:
                     t_coords.append(tuple((t_inds[0][temp],
                                            t_inds[1][temp])))
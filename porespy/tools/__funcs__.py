@@ -188,7 +188,7 @@ def subdivide(im, divs=2):
     first:
     >>> s_flat = s.flatten()
     >>> for i in s_flat:
-    ...     print(im[i].shape)
+    ...     print(im[tuple(i)].shape)
     (100, 100)
     (100, 100)
     (100, 100)
@@ -456,16 +456,8 @@ def extend_slice(s, shape, pad=1):
     also handled the extension beyond the boundary correctly.
     """
     pad = int(pad)
-    a = []
-    for i, dim in zip(s, shape):
-        start = 0
-        stop = dim
-        if i.start - pad >= 0:
-            start = i.start - pad
-        if i.stop + pad < dim:
-            stop = i.stop + pad
-        a.append(slice(start, stop, None))
-    return tuple(a)
+    return tuple(slice(max(i.start - pad, 0), min(i.stop + pad, dim), None)
+                 for i, dim in zip(s, shape))
 
 
 def randomize_colors(im, keep_vals=[0]):
@@ -240,6 +240,94 @@ class FilterTest():
         peaks = ps.filters.reduce_peaks(im)
         assert spim.label(im)[1] == spim.label(peaks)[1]
 
+    def test_find_peaks_footprints(self):
+        dt = self.im_dt
+        peaks_sphere = ps.filters.find_peaks(dt=dt, r_max=4)
+        peaks_cube = ps.filters.find_peaks(dt=dt, r_max=4, footprint='cube')
+        assert peaks_cube.sum() < peaks_sphere.sum()
+        assert not sp.any(peaks_cube * ~peaks_sphere)
+        peaks_ball = ps.filters.find_peaks(dt=dt, r_max=4, footprint=ball)
+        assert sp.all(peaks_ball == peaks_sphere)
+        # Only the spherical footprint is limited to 2D and 3D images
+        dt = spim.distance_transform_edt(np.arange(30) % 10 > 0)
+        peaks = ps.filters.find_peaks(dt=dt, r_max=2, footprint='cube')
+        assert peaks.sum() == 3
+        with pytest.raises(Exception):
+            ps.filters.find_peaks(dt=dt, r_max=2)
+
+    def test_trim_saddle_points(self):
+        dt = self.im_dt
+        peaks = ps.filters.find_peaks(dt=dt, r_max=4)
+        peaks_trimmed = ps.filters.trim_saddle_points(peaks=peaks, dt=dt)
+        assert peaks_trimmed.sum() < peaks.sum()
+        assert not sp.any(peaks_trimmed * ~peaks)
+
+    def test_trim_saddle_points_2d(self):
+        dt = np.ones([40, 40])
+        peaks = np.zeros_like(dt, dtype=bool)
+        # A plateau peak spanning two pixels is a true peak
+        dt[5, 5:7] = 5
+        peaks[5, 5:7] = True
+        # A peak lying between two higher pixels is a saddle point
+        dt[30, 29:32] = [4, 3, 4]
+        peaks[30, 30] = True
+        peaks = ps.filters.trim_saddle_points(peaks=peaks, dt=dt)
+        expected = np.zeros_like(peaks)
+        expected[5, 5:7] = True
+        assert sp.all(peaks == expected)
+
+    def test_trim_saddle_points_3d(self):
+        dt = np.ones([40, 40, 40])
+        peaks = np.zeros_like(dt, dtype=bool)
+        dt[5, 5, 5:7] = 5
+        peaks[5, 5, 5:7] = True
+        dt[30, 30, 29:32] = [4, 3, 4]
+        peaks[30, 30, 30] = True
+        peaks = ps.filters.trim_saddle_points(peaks=peaks, dt=dt)
+        expected = np.zeros_like(peaks)
+        expected[5, 5, 5:7] = True
+        assert sp.all(peaks == expected)
+
+    def test_trim_nearby_peaks(self):
+        im = np.ones([41, 41], dtype=bool)
+        im[0, :] = im[-1, :] = im[:, 0] = im[:, -1] = False
+        dt = spim.distance_transform_edt(im)
+        peaks = np.zeros_like(im)
+        peaks[20, 20] = True
+        peaks[20, 24] = True
+        peaks[5, 5] = True
+        peaks = ps.filters.trim_nearby_peaks(peaks=peaks, dt=dt)
+        assert peaks.sum() == 2
+        assert peaks[20, 20]
+        assert peaks[5, 5]
+        # Peaks equally far from the solid should still keep one
+        peaks = np.zeros_like(im)
+        peaks[20, 18] = True
+        peaks[20, 22] = True
+        peaks = ps.filters.trim_nearby_peaks(peaks=peaks, dt=dt)
+        assert peaks.sum() == 1
+
+    def test_snow_partitioning_float32_dt(self):
+        sp.random.seed(0)
+        im = ps.generators.blobs(shape=[200, 200], porosity=0.6,
+                                 blobiness=1.5)
+        dt = spim.distance_transform_edt(im)
+        snow64 = ps.filters.snow_partitioning(im=im, dt=dt, sigma=0,
+                                              return_all=True, randomize=False)
+        snow32 = ps.filters.snow_partitioning(im=im, dt=dt.astype(np.float32),
+                                              sigma=0, return_all=True,
+                                              randomize=False)
+        assert sp.all(snow64.peaks == snow32.peaks)
+        assert sp.all(snow64.regions == snow32.regions)
+
+    def test_snow_partitioning_dt_matches_scipy(self):
+        sp.random.seed(0)
+        im = ps.generators.blobs(shape=[60, 70, 80], porosity=0.6)
+        snow = ps.filters.snow_partitioning(im=im, return_all=True)
+        dt = spim.distance_transform_edt(im)
+        assert snow.dt.dtype == dt.dtype
+        assert sp.all(snow.dt == dt)
+
     def test_nphase_border_2d_no_diagonals(self):
         im = np.zeros([110, 110])
         for i in range(6):